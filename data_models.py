@@ -1,11 +1,24 @@
-from pydantic import BaseModel, Field
+from dataclasses import dataclass
+from functools import cached_property
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional
 from utils import create_excel_report
 
+__all__ = [
+    "EntitySelection",
+    "EntitySelections",
+    "CompetitorData",
+    "MissingItem",
+    "IntegrationOpportunity",
+    "EntityRecommendations",
+    "FinalState",
+]
+
 ### START: ENTITY SELECTION MODEL ###
 
 class EntitySelection(BaseModel):
     """Entity name with reasoning behind the selection and score of how relevant it is for the client page."""
+    model_config = ConfigDict(frozen=True)
     entity_name: str = Field(name="entity_name", description="The name of the entity.")
     entity_type: str = Field(name="entity_type", description="The type of the entity.")
     relevance_score: float = Field(name="relevance_score", description="The relevance score of the entity for the client page (0-1).")
@@ -14,34 +27,38 @@ class EntitySelection(BaseModel):
 
 class EntitySelections(BaseModel):
     """List of entity selections."""
+    model_config = ConfigDict(frozen=True, ignored_types=(cached_property,))
+
     selected_entities: List[EntitySelection] = Field(name="selected_entities", description="List of selected entities with relevance scores and reasoning.")
     
-    @property
+    @cached_property
     def to_markdown(self) -> str:
         """Convert the entity selections to a markdown string."""
-        markdown = ""
+        parts = []
         for entity in self.selected_entities:
-            markdown += f"- **{entity.entity_name}**\n"
-            markdown += f"  - **Relevance Score:** {entity.relevance_score}\n"
-            markdown += f"  - **Reasoning:** {entity.reasoning}\n"
-            markdown += f"  - **Competitors:** {', '.join(entity.competitors)}\n\n"
-        return markdown
+            parts.append(f"- **{entity.entity_name}**\n")
+            parts.append(f"  - **Relevance Score:** {entity.relevance_score}\n")
+            parts.append(f"  - **Reasoning:** {entity.reasoning}\n")
+            parts.append(f"  - **Competitors:** {', '.join(entity.competitors)}\n\n")
+        return "".join(parts)
     
 ### END: ENTITY SELECTION MODEL ###
 
 
 ### START: ENTITY RECOMMENDATION MODEL ###
 
-class CompetitorData(BaseModel):
-    """Represents data from a competitor."""
+@dataclass(slots=True, frozen=True)
+class CompetitorData:
+    """Represents data from a competitor. Internal only, so it skips Pydantic validation."""
     
-    salience: Optional[float] = Field(name="salience", description="The salience score of the entity in the competitor's content.", default=None)
-    density: Optional[float] = Field(name="density", description="The density of the keyword in the competitor's content.", default=None)
-    count: Optional[int] = Field(name="count", description="The number of times the keyword appears in the competitor's content.", default=None)
-    tf_idf: Optional[float] = Field(name="tf_idf", description="The TF-IDF score of the keyword in the competitor's content.", default=None)
+    salience: Optional[float] = None  # The salience score of the entity in the competitor's content.
+    density: Optional[float] = None  # The density of the keyword in the competitor's content.
+    count: Optional[int] = None  # The number of times the keyword appears in the competitor's content.
+    tf_idf: Optional[float] = None  # The TF-IDF score of the keyword in the competitor's content.
 
 class MissingItem(BaseModel):
     """Represents a missing item (entity or keyword)."""
+    model_config = ConfigDict(frozen=True)
     
     entity_name: str = Field(name="entity_name", description="The name of the missing item.")
     entity_type: str = Field(name="type", description="The exact type the user has provided for the missing item.")
@@ -50,6 +67,7 @@ class MissingItem(BaseModel):
 
 class IntegrationOpportunity(BaseModel):
     """Represents an integration opportunity for an entity."""
+    model_config = ConfigDict(frozen=True)
     
     section: str = Field(name="section", description="The section or area of the content where the entity can be integrated.")
     recommendation: str = Field(name="recommendation", description="Specific recommendation on how to integrate the entity.")
@@ -60,67 +78,66 @@ class IntegrationOpportunity(BaseModel):
 
 class EntityRecommendations(BaseModel):
     """Structured recommendation for integrating an entity."""
+    model_config = ConfigDict(frozen=True, ignored_types=(cached_property,))
     
     entity_context: MissingItem = Field(name="entity_context", description="Context about the entity and its competitors.")
     integration_opportunities: List[IntegrationOpportunity] = Field(name="integration_opportunities", description="List of integration opportunities for the entity.")
     
-    @property
+    @cached_property
     def to_markdown(self) -> str:
         """Convert the entity recommendation to a markdown string."""
-        markdown = f"### Entity Target: '{self.entity_context.entity_name.title()}'\n\n"
+        parts = [f"### Entity Target: '{self.entity_context.entity_name.title()}'\n\n"]
         for i, op in enumerate(self.integration_opportunities, start=1):
-            markdown += f"#### Opportunity {i}: {op.section}\n\n"
-            markdown += f"**Recommendation:** {op.recommendation}\n\n"
-            markdown += f"**Related Terms:** {', '.join(op.related_terms)}\n\n"
-            markdown += f"**Examples:**\n\n"
-            for example in op.examples:
-                markdown += f"- {example}\n"
-            markdown += "\n"
-            markdown += f"**Placement:** {op.placement}\n\n"
-            markdown += f"**Explanation:** {op.explanation}\n\n"
-        return markdown
+            parts.append(f"#### Opportunity {i}: {op.section}\n\n")
+            parts.append(f"**Recommendation:** {op.recommendation}\n\n")
+            parts.append(f"**Related Terms:** {', '.join(op.related_terms)}\n\n")
+            parts.append("**Examples:**\n\n")
+            parts.extend(f"- {example}\n" for example in op.examples)
+            parts.append("\n")
+            parts.append(f"**Placement:** {op.placement}\n\n")
+            parts.append(f"**Explanation:** {op.explanation}\n\n")
+        return "".join(parts)
     
 ### END: ENTITY RECOMMENDATION MODEL ###
 
 
 ### CONSOLIDATED DATA MODEL ###
 
-class FinalState(BaseModel):
+@dataclass(frozen=True, eq=False)
+class FinalState:
     """Represents the state of the analysis process."""
-    client_url: str = Field(name="client_url", description="The URL of the client's page.")
-    competitor_urls: List[str] = Field(name="competitor_urls", description="List of competitor URLs.")
-    analysis_results: List[dict] = Field(name="analysis_results", description="Results of the content analysis including the client and competitor entities and keywords.")
-    comparison_results: dict = Field(name="comparison_results", description="Comparison results between the client and competitors.")
-    selected_entities: EntitySelections = Field(name="selected_entities", description="List of selected entities with relevance scores and reasoning.")
-    recommendation_overview: List[EntityRecommendations] = Field(name="recommendation_overview", description="Structured recommendation for integrating entities.")
+
+    client_url: str  # The URL of the client's page.
+    competitor_urls: List[str]  # List of competitor URLs.
+    analysis_results: List[dict]  # Results of the content analysis including the client and competitor entities and keywords.
+    comparison_results: dict  # Comparison results between the client and competitors.
+    selected_entities: EntitySelections  # List of selected entities with relevance scores and reasoning.
+    recommendation_overview: List[EntityRecommendations]  # Structured recommendation for integrating entities.
     
     
-    @property
+    @cached_property
     def to_markdown(self) -> str:
         """Create a markdown report from the analysis results."""
-        markdown = f"# Content Analysis Report\n\n"
-        markdown += f"**Client Page:** {self.client_url}\n\n"
-        markdown += "**Competitor Pages:**\n\n"
-        for url in self.competitor_urls:
-            markdown += f"- {url}\n"
-        markdown += "\n"
-        markdown += "\n"
-        markdown += "## Selected Entities for Integration\n\n"
-        markdown += self.selected_entities.to_markdown
-        markdown += "\n"
-        markdown += "## Entity Recommendations\n\n"
-        for rec in self.recommendation_overview:
-            markdown += rec.to_markdown
-        return markdown
+        parts = ["# Content Analysis Report\n\n"]
+        parts.append(f"**Client Page:** {self.client_url}\n\n")
+        parts.append("**Competitor Pages:**\n\n")
+        parts.extend(f"- {url}\n" for url in self.competitor_urls)
+        parts.append("\n")
+        parts.append("\n")
+        parts.append("## Selected Entities for Integration\n\n")
+        parts.append(self.selected_entities.to_markdown)
+        parts.append("\n")
+        parts.append("## Entity Recommendations\n\n")
+        parts.extend(rec.to_markdown for rec in self.recommendation_overview)
+        return "".join(parts)
     
-    @property
-    def to_excel(self) -> bytes:
-        """Create an Excel report from the analysis results."""
-        return create_excel_report({
+    def to_excel(self, out_path: str) -> None:
+        """Write an Excel report of the analysis results to out_path."""
+        create_excel_report({
             "client_url": self.client_url,
             "competitor_urls": self.competitor_urls,
             "analysis_results": self.analysis_results,
             "comparison_results": self.comparison_results
-        })
+        }, out_path)
 
 
@@ -1,187 +1,284 @@
+import atexit
+import asyncio
 import os
+import hashlib
 from collections import Counter
 from google.cloud import language_v1
+from google.oauth2 import service_account
 from loguru import logger
-from bs4 import BeautifulSoup
 import math
 import re
-from typing import List, Set, Dict, Any
+import sys
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Set, Dict, Any, Iterator, Optional, Tuple
 from langchain_openai import ChatOpenAI
 import aiohttp
-from aiohttp import ClientSession
+from aiohttp import ClientSession, hdrs
+from html_parser import parse_html
 from data_models import EntityRecommendations, EntitySelection, EntitySelections
 from dotenv import load_dotenv
-
-load_dotenv()
+from diskcache import Cache
 
 # Common English stop words
-STOP_WORDS = {
+STOP_WORDS = frozenset({
     'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'he',
     'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the', 'to', 'was', 'were',
-    'will', 'with', 'the', 'this', 'but', 'they', 'have', 'had', 'what', 'when',
+    'will', 'with', 'this', 'but', 'they', 'have', 'had', 'what', 'when',
     'where', 'who', 'which', 'why', 'how', 'all', 'any', 'both', 'each', 'few',
     'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own',
     'same', 'so', 'than', 'too', 'very', 'can', 'my', 'your', 'i', 'you', 'we'
-}
+})
+
+# Word characters only, matching the old strip-punctuation-then-split behaviour
+_TOKEN_RE = re.compile(r'\w+')
 
-# Initialize LLM
-model = ChatOpenAI(model="gpt-4o")
+# Tokens up to this length are interned so repeats across documents share one string
+_INTERN_MAX_LENGTH = 32
 
-def tokenize(text: str) -> List[str]:
-    """Split text into words, removing punctuation and converting to lowercase."""
-    # Remove special characters and convert to lowercase
-    text = re.sub(r'[^\w\s]', ' ', text.lower())
-    # Split on whitespace and filter out empty strings
-    return [word for word in text.split() if word]
+# Scraping: ask for compressed responses and cap how much of a page is read
+SCRAPE_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "Mozilla/5.0 (compatible; ai-entity-opportunity-analyzer)",
+}
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+MAX_CONTENT_BYTES = 2_000_000
+
+# Natural Language API results are cached here, keyed by request version, service account and a hash of the analyzed text
+NL_CACHE_DIR = "./.cache/nl_api"
+# Bump when the request features or the stored result shape change, so older entries are not reused
+NL_CACHE_VERSION = "annotate_text-entities-sentiment-v1"
+
+# Upper bound on simultaneous LLM requests, to stay clear of OpenAI rate limits
+LLM_MAX_CONCURRENCY = 8
+
+@lru_cache(maxsize=1)
+def get_model() -> ChatOpenAI:
+    """Returns the shared LLM, loading .env and creating it on first use."""
+    load_dotenv()
+    return ChatOpenAI(model="gpt-4o")
+
+@lru_cache(maxsize=None)
+def get_structured_model(schema):
+    """Returns the structured-output wrapper for a schema, built once per schema."""
+    return get_model().with_structured_output(schema)
+
+@lru_cache(maxsize=1)
+def load_credentials(credentials_path: str) -> service_account.Credentials:
+    """Loads the service account credentials once; they are not tied to an event loop, so they can be reused across runs."""
+    return service_account.Credentials.from_service_account_file(credentials_path)
+
+def create_language_client(credentials_path: str) -> language_v1.LanguageServiceAsyncClient:
+    """Creates a Natural Language client for the current event loop; use it with `async with` so it is closed afterwards."""
+    return language_v1.LanguageServiceAsyncClient(credentials=load_credentials(credentials_path))
+
+def create_session() -> ClientSession:
+    """Creates the HTTP session used to scrape a run's pages, so keep-alive connections and DNS lookups are reused between them."""
+    connector = aiohttp.TCPConnector(limit=64, limit_per_host=8, keepalive_timeout=30, ttl_dns_cache=300)
+    return ClientSession(connector=connector, headers=SCRAPE_HEADERS)
+
+def iter_tokens(text: str) -> Iterator[str]:
+    """Yield lowercased words from text, skipping stop words, in a single pass."""
+    return (
+        sys.intern(word) if len(word) <= _INTERN_MAX_LENGTH else word
+        for word in _TOKEN_RE.findall(text.lower())
+        if word not in STOP_WORDS
+    )
 
 def get_ngrams(words: List[str], n: int = 2, min_frequency: int = 1) -> Dict[str, int]:
     """Generate n-grams from a list of words with frequency filtering."""
-    ngrams = []
-    for i in range(len(words) - n + 1):
-        ngram = ' '.join(words[i:i + n])
-        ngrams.append(ngram)
-
-    # Count frequencies and filter
-    ngram_counts = Counter(ngrams)
-    return {ngram: count for ngram, count in ngram_counts.items() if count >= min_frequency}
-
-def remove_stopwords(words: List[str]) -> List[str]:
-    """Remove stop words from a list of words."""
-    return [word for word in words if word not in STOP_WORDS]
-
-def calculate_tf_idf(term, document, all_documents):
-    """Calculates TF-IDF for a term in a document."""
-    term_count = document.lower().split().count(term.lower())
+    # zip over offset views yields each n-gram as a tuple without slicing per position;
+    # only the surviving n-grams are joined into strings
+    ngram_counts = Counter(zip(*(words[i:] for i in range(n))))
+    return {' '.join(ngram): count for ngram, count in ngram_counts.items() if count >= min_frequency}
+
+def build_corpus_stats(document_words: List[List[str]]) -> Tuple[Counter, int]:
+    """Counts how many of the tokenized documents contain each word."""
+    document_frequency = Counter()
+    for words in document_words:
+        document_frequency.update(set(words))
+    return document_frequency, len(document_words)
+
+def calculate_tf_idf(term: str, word_counts: Counter, total_words: int, document_frequency: Counter, n_docs: int) -> float:
+    """Calculates TF-IDF for a term in a document from precomputed counts."""
+    term_count = word_counts.get(term, 0)
     if term_count == 0:
         return 0
-    tf = term_count / len(document.lower().split())
-    
-    document_count = sum(1 for doc in all_documents if term.lower() in doc.lower())
+    tf = term_count / total_words
+
+    document_count = document_frequency.get(term, 0)
     if document_count == 0:
         return 0
-    idf = math.log(len(all_documents) / document_count)
+    idf = math.log(n_docs / document_count)
     return tf * idf
 
+@lru_cache(maxsize=1)
+def _get_parse_pool() -> ProcessPoolExecutor:
+    """Returns the process pool used for HTML parsing, started once per process and shut down at exit.
+
+    Spawned workers re-import the main script, so the pool is kept for the life of the process rather than rebuilt per run.
+    """
+    pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    atexit.register(pool.shutdown)
+    return pool
+
+async def fetch_html(url: str, session: ClientSession) -> Optional[Tuple[bytes, Optional[str]]]:
+    """Downloads up to MAX_CONTENT_BYTES of an HTML page, returning the body and its charset."""
+    async with session.get(url, timeout=10) as response:
+        response.raise_for_status()  # Raise an exception for bad status codes
+        # Pages served without a Content-Type header are still parsed; only explicit non-HTML types are skipped
+        if hdrs.CONTENT_TYPE in response.headers and response.content_type not in HTML_CONTENT_TYPES:
+            logger.warning(f"Skipping {url}: unsupported content type {response.content_type}")
+            return None
+        # Read at most MAX_CONTENT_BYTES of the (transparently decompressed) body
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            body += chunk
+            if len(body) >= MAX_CONTENT_BYTES:
+                break
+        return bytes(body[:MAX_CONTENT_BYTES]), response.charset
+
 async def scrape_content(url: str, session: ClientSession):
     """Scrapes content from a URL."""
     try:
-        async with session.get(url, timeout=10) as response:
-            response.raise_for_status()  # Raise an exception for bad status codes
-            html = await response.text()
-            soup = BeautifulSoup(html, 'html.parser')
-            # Remove script and style tags
-            for script in soup(["script", "style"]):
-                script.extract()
-            text = soup.get_text(separator=' ', strip=True)
-            return text
+        fetched = await fetch_html(url, session)
     except aiohttp.ClientError as e:
         print(f"Error scraping {url}: {e}")
         return None
+    if fetched is None:
+        return None
+    # Parsing is CPU-bound, so run it in another process to keep the event loop free for other downloads
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_parse_pool(), parse_html, *fetched)
+    except Exception as e:
+        logger.warning(f"Error parsing {url}: {e}")
+        return None
+
+@lru_cache(maxsize=1)
+def _get_nl_cache() -> Cache:
+    """Returns the on-disk cache of Natural Language API results, opening it on first use."""
+    return Cache(NL_CACHE_DIR)
+
+async def analyze_content(content: str, client: language_v1.LanguageServiceAsyncClient, account_email: str) -> Dict[str, Any]:
+    """Analyzes entities and sentiment using Google Cloud Natural Language API, reusing cached results for identical text.
+
+    Keyword metrics need the whole corpus, so they are added afterwards by analyze_keywords.
+    """
+    cache = _get_nl_cache()
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    cache_key = (NL_CACHE_VERSION, account_email, content_hash)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Using cached Natural Language analysis for content {content_hash[:12]}")
+        return cached
+
+    type_ = language_v1.Document.Type.PLAIN_TEXT
+    document = {"content": content, "type_": type_}
+    encoding_type = language_v1.EncodingType.UTF8
+
+    # One annotateText call returns both entities and document sentiment
+    response = await client.annotate_text(
+        request={
+            "document": document,
+            "features": {"extract_entities": True, "extract_document_sentiment": True},
+            "encoding_type": encoding_type,
+        }
+    )
 
-async def analyze_content(content, credentials_path, all_documents):
-    """Analyzes content using Google Cloud Natural Language API."""
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
-
-    async with language_v1.LanguageServiceAsyncClient() as client:
-        type_ = language_v1.Document.Type.PLAIN_TEXT
-        document = {"content": content, "type_": type_}
-        encoding_type = language_v1.EncodingType.UTF8
-
-        # Analyze Entities
-        response = await client.analyze_entities(
-            request={"document": document, "encoding_type": encoding_type}
-        )
-
-        # Analyze Sentiment
-        sentiment_response = await client.analyze_sentiment(
-            request={"document": document, "encoding_type": encoding_type}
-        )
-
-        entities = {}
-        for entity in response.entities:
-            entities[entity.name] = {
-                "type": language_v1.Entity.Type(entity.type_).name,
-                "salience": entity.salience,
-                "mentions": [],
-                "sentiment": {
-                    "score": entity.sentiment.score,
-                    "magnitude": entity.sentiment.magnitude
-                }
+    entities = {}
+    for entity in response.entities:
+        entities[entity.name] = {
+            "type": language_v1.Entity.Type(entity.type_).name,
+            "salience": entity.salience,
+            "mentions": [],
+            "sentiment": {
+                "score": entity.sentiment.score,
+                "magnitude": entity.sentiment.magnitude
             }
-            for mention in entity.mentions:
-                entities[entity.name]["mentions"].append({
-                    "text": mention.text.content,
-                    "type": language_v1.EntityMention.Type(mention.type_).name,
-                    "begin_offset": mention.text.begin_offset
-                })
-
-        # Basic Keyword Analysis
-        words = tokenize(content)
-        words = remove_stopwords(words)
-        word_counts = Counter(words)
-        total_words = len(words)
-
-        # Phrase Extraction
-        phrases = get_ngrams(words)
-        phrase_counts = Counter(phrases)
-
-        keyword_analysis = {}
-        for entity_name, entity_data in entities.items():
-            if entity_name in word_counts:
-                keyword_analysis[entity_name] = {
-                    "density": (word_counts[entity_name] / total_words) * 100,
-                    "count": word_counts[entity_name],
-                    "phrase_counts": phrase_counts.get(entity_name, 0),
-                    "tf_idf": calculate_tf_idf(entity_name, content, all_documents)
-                }
-            else:
-                keyword_analysis[entity_name] = {
-                    "density": 0,
-                    "count": 0,
-                    "phrase_counts": 0,
-                    "tf_idf": 0
-                }
-
-        return {
-            "entities": entities,
-            "document_sentiment": {
-                "score": sentiment_response.document_sentiment.score,
-                "magnitude": sentiment_response.document_sentiment.magnitude
-            },
-            "keyword_analysis": keyword_analysis,
         }
+        for mention in entity.mentions:
+            entities[entity.name]["mentions"].append({
+                "text": mention.text.content,
+                "type": language_v1.EntityMention.Type(mention.type_).name,
+                "begin_offset": mention.text.begin_offset
+            })
+
+    result = {
+        "entities": entities,
+        "document_sentiment": {
+            "score": response.document_sentiment.score,
+            "magnitude": response.document_sentiment.magnitude
+        },
+    }
+    cache.set(cache_key, result)
+    return result
+
+def analyze_keywords(entities: Dict[str, Any], words: List[str], document_frequency: Counter, n_docs: int) -> Dict[str, Any]:
+    """Computes density, count, phrase count and TF-IDF of a document's entities from its tokens."""
+    # Basic Keyword Analysis
+    word_counts = Counter(words)
+    total_words = len(words)
+
+    # Phrase Extraction, one n-gram table per multi-word name length, built on first use
+    phrases_by_length = {}
+
+    keyword_analysis = {}
+    for entity_name, entity_data in entities.items():
+        # Tokenize the name like the page so it matches the n-gram keys
+        name_tokens = list(iter_tokens(entity_name))
+        phrase_count = 0
+        if len(name_tokens) > 1:
+            n = len(name_tokens)
+            if n not in phrases_by_length:
+                phrases_by_length[n] = get_ngrams(words, n)
+            phrase_count = phrases_by_length[n].get(' '.join(name_tokens), 0)
+        if entity_name in word_counts:
+            keyword_analysis[entity_name] = {
+                "density": (word_counts[entity_name] / total_words) * 100,
+                "count": word_counts[entity_name],
+                "phrase_counts": phrase_count,
+                "tf_idf": calculate_tf_idf(entity_name, word_counts, total_words, document_frequency, n_docs)
+            }
+        else:
+            keyword_analysis[entity_name] = {
+                "density": 0,
+                "count": 0,
+                "phrase_counts": phrase_count,
+                "tf_idf": 0
+            }
+
+    return keyword_analysis
 
 def compare_pages(client_analysis, competitive_analyses, competitive_pages):
     """Compares the client page analysis to the competitive pages."""
-    client_entities = client_analysis.get("entities", {})
-    client_keywords = client_analysis.get("keyword_analysis", {})
+    client_entity_names = client_analysis.get("entities", {}).keys()
+    client_keyword_names = client_analysis.get("keyword_analysis", {}).keys()
 
     missing_entities = {}
     missing_keywords = {}
 
-    for i, comp_analysis in enumerate(competitive_analyses):
+    for comp_analysis, comp_url in zip(competitive_analyses, competitive_pages):
         comp_entities = comp_analysis.get("entities", {})
         comp_keywords = comp_analysis.get("keyword_analysis", {})
-        comp_url = competitive_pages[i]
 
+        # Walk the competitor's own ordering (the API returns entities by salience)
+        # rather than a set difference, so the report order stays stable
         for entity_name, entity_data in comp_entities.items():
-            if entity_name not in client_entities:
-                if entity_name not in missing_entities:
-                    missing_entities[entity_name] = {
-                        "competitors": {comp_url: {"salience": entity_data["salience"]}},
-                        "type": entity_data["type"]
-                    }
-                else:
-                    missing_entities[entity_name]["competitors"][comp_url] = {"salience": entity_data["salience"]}
+            if entity_name in client_entity_names:
+                continue
+            salience = entity_data["salience"]
+            missing_entity = missing_entities.setdefault(
+                entity_name, {"competitors": {}, "type": entity_data["type"], "max_salience": salience}
+            )
+            missing_entity["competitors"][comp_url] = {"salience": salience}
+            if salience > missing_entity["max_salience"]:
+                missing_entity["max_salience"] = salience
 
         for keyword, data in comp_keywords.items():
-            if keyword not in client_keywords:
-                if keyword not in missing_keywords:
-                    missing_keywords[keyword] = {
-                        "competitors": {comp_url: data},
-                    }
-                else:
-                    missing_keywords[keyword]["competitors"][comp_url] = data
+            if keyword in client_keyword_names:
+                continue
+            missing_keywords.setdefault(keyword, {"competitors": {}})["competitors"][comp_url] = data
 
     # Filter missing entities to only include those present in at least 2 competitors
     filtered_missing_entities = {
@@ -203,9 +300,13 @@ def compare_pages(client_analysis, competitive_analyses, competitive_pages):
     }
 
 
-async def generate_entity_recommendations(entity_item: EntitySelection, client_content: str) -> EntityRecommendations:
-    """Generates structured recommendations for integrating a target entity."""
-    instructions = """
+class _SafeDict(dict):
+    """Leaves unknown placeholders in a prompt template untouched instead of raising KeyError."""
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+# Static instructions go in the system message; only the per-entity input is formatted per call
+_RECOMMENDATION_SYSTEM_PROMPT = """
     You are an expert SEO content strategist. Your task is to analyze a client's webpage content and provide specific, actionable recommendations on how to integrate a target entity effectively.
 
     **Context:**
@@ -216,21 +317,10 @@ async def generate_entity_recommendations(entity_item: EntitySelection, client_c
     *   **Provide value to users:** Ensure the content is informative, engaging, and addresses user needs.
     *   **Use related terms:** Incorporate synonyms, LSI keywords, and related concepts to expand the semantic scope.
 
-    **Input:**
-
-    *   **Target Entity Info:** 
-        *   **Entity Name**: "{entity_name}"
-        *   **Relevance Score**: {relevance_score}
-        *   **Reasoning**: {reasoning}
-    *   **Client Page Content:**
-        ```
-        {client_page_content}
-        ```
-
     **Instructions:**
 
     1.  **Analyze the Client Page Content:** Review the provided content to understand its current focus, structure, and tone.
-    2.  **Research the Target Entity:** Understand the meaning of "{entity_name}", its key aspects, related terms, and user intent.
+    2.  **Research the Target Entity:** Understand the meaning of the target entity, its key aspects, related terms, and user intent.
     3.  **Identify Integration Opportunities:** Determine where the entity and related terms can be naturally incorporated into the existing content.
     4.  **Provide Specific Recommendations:**
         *   Suggest specific sections or paragraphs where the entity can be discussed.
@@ -240,33 +330,50 @@ async def generate_entity_recommendations(entity_item: EntitySelection, client_c
         *   Explain *why* each recommendation is beneficial for both SEO and user experience.
     5.  **Focus on User Value:** Ensure that the recommendations will result in content that is valuable, informative, and engaging for users.
     6.  **Avoid Keyword Stuffing:** Do not recommend simply repeating the entity's name throughout the content.
+
+    Provide a structured recommendation for integrating the target entity.
     """
-    prompt = instructions.format(
+
+_RECOMMENDATION_USER_PROMPT = """
+    **Input:**
+
+    *   **Target Entity Info:** 
+        *   **Entity Name**: "{entity_name}"
+        *   **Relevance Score**: {relevance_score}
+        *   **Reasoning**: {reasoning}
+    *   **Client Page Content:**
+        ```
+        {client_page_content}
+        ```
+    """
+
+def _recommendation_inputs(entity_item: EntitySelection, client_content: str) -> List[Tuple[str, str]]:
+    """Builds the LLM messages asking for recommendations for one entity."""
+    prompt = _RECOMMENDATION_USER_PROMPT.format_map(_SafeDict(
         entity_name=entity_item.entity_name, 
         relevance_score=entity_item.relevance_score, 
         reasoning=entity_item.reasoning, 
         client_page_content=client_content
-    )
-    inputs_for_recommendation = [
-        ("system", "Provide a structured recommendation for integrating the target entity."), 
+    ))
+    return [
+        ("system", _RECOMMENDATION_SYSTEM_PROMPT), 
         ("user", prompt)
     ]
-    structured_recommendation_model = model.with_structured_output(EntityRecommendations)
-    output = await structured_recommendation_model.ainvoke(inputs_for_recommendation)
-    logger.info(f'EntityRecommendation: \n\n {output}')
-    return  output
 
+async def generate_entity_recommendations_batch(entity_items: List[EntitySelection], client_content: str) -> List[EntityRecommendations]:
+    """Generates recommendations for several entities in one concurrent batch of LLM calls."""
+    # The LLM can select the same entity twice; request each entity only once
+    unique_items = {}
+    for entity_item in entity_items:
+        unique_items.setdefault(entity_item.entity_name, entity_item)
+    all_inputs = [_recommendation_inputs(entity_item, client_content) for entity_item in unique_items.values()]
+    outputs = await get_structured_model(EntityRecommendations).abatch(all_inputs, config={"max_concurrency": LLM_MAX_CONCURRENCY})
+    for output in outputs:
+        logger.info(f'EntityRecommendation: \n\n {output}')
+    return outputs
 
-async def select_entities_for_integration(missing_entities: Dict[str, Any]) -> EntitySelections:
-    """Selects the most relevant entities for integration using AI."""
-    if not missing_entities:
-        return EntitySelections(selected_entities=[])
 
-    # get array of objects with these keys {"entity_name", "entity_type", "count_of_competitors_with_entity, "max_salience"}
-    entities = [{"entity_name": entity_name, "entity_type": data["type"], "count_of_competitors_with_entity": len(data["competitors"]), "max_salience": max([comp["salience"] for comp in data["competitors"].values()]), "competitors": list(data["competitors"].keys())} for entity_name, data in missing_entities.items()]
-    structured_string_of_entities = "\n".join([f"- Entity Name: {entity['entity_name']}, Entity Type: {entity['entity_type']}, Count of Competitors with Entity: {entity['count_of_competitors_with_entity']}, Max Salience: {entity['max_salience']}, Competitors: {entity['competitors']}" for entity in entities])
-    
-    prompt = """
+_SELECTION_SYSTEM_PROMPT = """
     You are an expert SEO content strategist. Your task is to analyze a list of missing entities and select the top 10 most relevant entities to integrate into a client's webpage.
 
     **Context:**
@@ -277,25 +384,39 @@ async def select_entities_for_integration(missing_entities: Dict[str, Any]) -> E
     *   **Provide a relevance score:** Provide a relevance score between 0 and 1 for each entity.
     *   **Provide reasoning:** Provide reasoning behind the selection of each entity.
 
+    **Instructions:**
+
+    1.  **Analyze the Missing Entities:** Review the provided list of missing entities to understand their meaning and relevance.
+    2.  **Select Top 10 Entities:** Select the top 10 most relevant entities to integrate into the client's webpage.
+    3.  **Provide a List of Entities:** Provide a list of the selected entities with their relevance scores and reasoning.
+
+    Select the top 10 most relevant entities to integrate with relevance scores and reasoning.
+    """
+
+_SELECTION_USER_PROMPT = """
     **Input:**
 
     *   **Missing Entities (includes the entity name, count of competitors with the entity, and maximum salience. use this context to determine relevance):**
         ```
         {entity_details}
         ```
+    """
 
-    **Instructions:**
+async def select_entities_for_integration(missing_entities: Dict[str, Any]) -> EntitySelections:
+    """Selects the most relevant entities for integration using AI."""
+    if not missing_entities:
+        return EntitySelections(selected_entities=[])
 
-    1.  **Analyze the Missing Entities:** Review the provided list of missing entities to understand their meaning and relevance.
-    2.  **Select Top 10 Entities:** Select the top 10 most relevant entities to integrate into the client's webpage.
-    3.  **Provide a List of Entities:** Provide a list of the selected entities with their relevance scores and reasoning.
-    """
+    # one line per entity with its type, count of competitors, max salience (tracked by compare_pages) and competitors
+    structured_string_of_entities = "\n".join(
+        f"- Entity Name: {entity_name}, Entity Type: {data['type']}, Count of Competitors with Entity: {len(data['competitors'])}, Max Salience: {data['max_salience']}, Competitors: {list(data['competitors'])}"
+        for entity_name, data in missing_entities.items()
+    )
     
     inputs_for_selection = [
-        ("system", "Select the top 10 most relevant entities to integrate with relevance scores and reasoning."), 
-        ("user", prompt.format(entity_details=structured_string_of_entities))
+        ("system", _SELECTION_SYSTEM_PROMPT), 
+        ("user", _SELECTION_USER_PROMPT.format_map(_SafeDict(entity_details=structured_string_of_entities)))
     ]
-    structured_selection_model = model.with_structured_output(EntitySelections)
-    output = await structured_selection_model.ainvoke(inputs_for_selection)
+    output = await get_structured_model(EntitySelections).ainvoke(inputs_for_selection)
     logger.info(f'EntitySelections: \n\n {output}')
     return output
\ No newline at end of file
@@ -0,0 +1,20 @@
+import codecs
+from bs4 import BeautifulSoup
+from typing import Optional
+
+def _decode(body: bytes, charset: Optional[str]) -> str:
+    """Decodes a page body, falling back to utf-8 when the declared charset is missing or unknown."""
+    try:
+        encoding = codecs.lookup(charset).name if charset else "utf-8"
+    except LookupError:
+        encoding = "utf-8"
+    return body.decode(encoding, errors="ignore")
+
+def parse_html(body: bytes, charset: Optional[str]) -> str:
+    """Extracts the visible text from an HTML page."""
+    html = _decode(body, charset)
+    soup = BeautifulSoup(html, 'lxml')
+    # Remove script and style tags
+    for script in soup(["script", "style"]):
+        script.decompose()
+    return soup.get_text(separator=' ', strip=True)
@@ -1,6 +1,5 @@
 import os
 import asyncio
-import aiohttp
 from loguru import logger
 from typing import List
 from datetime import datetime
@@ -9,10 +8,17 @@ from collections import defaultdict
 from utils import get_competitor_name, validate_urls
 from data_models import FinalState
 from entity_analysis import (
-    analyze_content, scrape_content, compare_pages, 
-    select_entities_for_integration, generate_entity_recommendations
+    analyze_content, analyze_keywords, build_corpus_stats, iter_tokens, scrape_content, compare_pages, 
+    select_entities_for_integration, generate_entity_recommendations_batch,
+    create_session, create_language_client, load_credentials
 )
 
+# Prefix for report file names, e.g. 20240101_120000_analysis_report.md
+REPORT_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+# Upper bound on pages being scraped and analyzed at the same time
+PAGE_MAX_CONCURRENCY = 8
+
 async def main_analysis(client_url: str, competitor_urls: List[str], credentials_path: str, output_folder: str):
     """Performs the entire content analysis and generates a report."""
     try:
@@ -26,85 +32,104 @@ async def main_analysis(client_url: str, competitor_urls: List[str], credentials
         used_domains = defaultdict(int)
         competitor_names = {url: get_competitor_name(url, used_domains) for url in competitor_urls}
 
-        async with aiohttp.ClientSession() as session:
-            # Scrape content
-            logger.info("Scraping content from URLs...")
-            scrape_tasks = [scrape_content(client_url, session)] + [scrape_content(url, session) for url in competitor_urls]
-            scrape_results = await asyncio.gather(*scrape_tasks)
-
-            client_content = scrape_results[0]
+        semaphore = asyncio.Semaphore(PAGE_MAX_CONCURRENCY)
+        # Cached NL results are kept per service account
+        account_email = load_credentials(credentials_path).service_account_email
+
+        async def analyze_page(content: str):
+            """Sends scraped text to the NL API and tokenizes it for keyword scoring."""
+            analysis = await analyze_content(content, nl_client, account_email)
+            return content, list(iter_tokens(content)), analysis
+
+        async def scrape_then_analyze(url: str):
+            """Scrapes a page and sends it to the NL API once the client page is known to be usable."""
+            async with semaphore:
+                content = await scrape_content(url, session)
+                # Competitors download alongside the client page, but no NL calls are paid for if the client scrape failed
+                if not content or not await client_scrape:
+                    return None
+                return await analyze_page(content)
+
+        # The session and NL client are bound to this event loop, so they are created per run and closed once the pages are analyzed
+        async with create_session() as session, create_language_client(credentials_path) as nl_client:
+            logger.info("Scraping and analyzing content from URLs...")
+            client_scrape = asyncio.create_task(scrape_content(client_url, session))
+            competitor_results = asyncio.gather(*(scrape_then_analyze(url) for url in competitor_urls))
+
+            client_content = await client_scrape
             if not client_content:
+                competitor_results.cancel()
                 logger.error("Failed to scrape client page.")
                 return
 
-            competitive_contents = [content for content in scrape_results[1:] if content]
-            valid_competitor_urls = [url for url, content in zip(competitor_urls, scrape_results[1:]) if content]
-
-            all_documents = [client_content] + competitive_contents
-            
-            # Analyze content
-            logger.info("Analyzing scraped content...")
-            analysis_tasks = [analyze_content(client_content, credentials_path, all_documents)] + [
-                analyze_content(content, credentials_path, all_documents) for content in competitive_contents
-            ]
-            analysis_results = await asyncio.gather(*analysis_tasks)
-
-            client_analysis = analysis_results[0]
-            competitive_analyses = analysis_results[1:]
-
-            # Compare results
-            logger.info("Comparing client content with competitors...")
-            comparison_results = compare_pages(client_analysis, competitive_analyses, valid_competitor_urls)
-
-            # Update competitor names in the results
-            for analysis_type in ["missing_entities", "missing_keywords"]:
-                for item_name, item_data in comparison_results.get(analysis_type, {}).items():
-                    item_data["competitors"] = {competitor_names[url]: metrics for url, metrics in item_data["competitors"].items()}
-
-            # Select entities for integration
-            logger.info("Selecting entities for integration...")
-            selected_entities_response = await select_entities_for_integration(comparison_results.get("missing_entities", {}))
-            selected_entities = selected_entities_response.selected_entities
-
-            # Generate recommendations
-            logger.info("Generating recommendations for selected entities...")
-            recommendation_tasks = [generate_entity_recommendations(entity_selection, client_content) for entity_selection in selected_entities]
-            recommendations = await asyncio.gather(*recommendation_tasks)
-
-            # Export results
-            logger.info("Creating analysis report...")
-            current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            final_state = FinalState(
-                client_url=client_url,
-                competitor_urls=valid_competitor_urls,
-                analysis_results=analysis_results,
-                comparison_results=comparison_results,
-                selected_entities=selected_entities_response,
-                recommendation_overview=recommendations
-            )
-            
-            markdown = final_state.to_markdown
-            excel = final_state.to_excel
-
-            md_filename = f"{current_time}_analysis_report.md"
-            excel_filename = f"{current_time}_analysis_data.xlsx"
-            
-            os.makedirs(output_folder, exist_ok=True)
-            output_path_md = os.path.join(output_folder, md_filename)
-            output_path_excel = os.path.join(output_folder, excel_filename)
-            
-            with open(output_path_md, "w") as file:
-                file.write(markdown)
-            
-            logger.info(f"Markdown report saved to: {output_path_md}")
-            
-            with open(output_path_excel, "wb") as file:
-                file.write(excel)
-
-            logger.info(f"Excel report saved to: {output_path_excel}")
-            logger.info("Analysis process completed successfully")
-            
+            page_results = [await analyze_page(client_content), *await competitor_results]
+
+        valid_competitor_urls = [url for url, result in zip(competitor_urls, page_results[1:]) if result]
+        valid_results = [result for result in page_results if result]
+
+        # TF-IDF needs document frequencies across every page, so keywords are scored once all pages are in
+        document_frequency, n_docs = build_corpus_stats([words for _, words, _ in valid_results])
+        analysis_results = [
+            {**analysis, "keyword_analysis": analyze_keywords(analysis["entities"], words, document_frequency, n_docs)}
+            for _, words, analysis in valid_results
+        ]
+
+        client_analysis = analysis_results[0]
+        competitive_analyses = analysis_results[1:]
+
+        # Compare results
+        logger.info("Comparing client content with competitors...")
+        comparison_results = compare_pages(client_analysis, competitive_analyses, valid_competitor_urls)
+
+        # Update competitor names in the results
+        for analysis_type in ["missing_entities", "missing_keywords"]:
+            for item_data in comparison_results.get(analysis_type, {}).values():
+                competitors = item_data["competitors"]
+                # Rename keys in place; names never collide with URLs, and insertion order is kept
+                for url in list(competitors):
+                    competitors[competitor_names[url]] = competitors.pop(url)
+
+        # Select entities for integration
+        logger.info("Selecting entities for integration...")
+        selected_entities_response = await select_entities_for_integration(comparison_results.get("missing_entities", {}))
+        selected_entities = selected_entities_response.selected_entities
+
+        # Generate recommendations
+        logger.info("Generating recommendations for selected entities...")
+        recommendations = await generate_entity_recommendations_batch(selected_entities, client_content)
+
+        # Export results
+        logger.info("Creating analysis report...")
+        current_time = datetime.now().strftime(REPORT_TIMESTAMP_FORMAT)
+        
+        final_state = FinalState(
+            client_url=client_url,
+            competitor_urls=valid_competitor_urls,
+            analysis_results=analysis_results,
+            comparison_results=comparison_results,
+            selected_entities=selected_entities_response,
+            recommendation_overview=recommendations
+        )
+        
+        markdown = final_state.to_markdown
+
+        md_filename = f"{current_time}_analysis_report.md"
+        excel_filename = f"{current_time}_analysis_data.xlsx"
+        
+        os.makedirs(output_folder, exist_ok=True)
+        output_path_md = os.path.join(output_folder, md_filename)
+        output_path_excel = os.path.join(output_folder, excel_filename)
+        
+        with open(output_path_md, "w") as file:
+            file.write(markdown)
+        
+        logger.info(f"Markdown report saved to: {output_path_md}")
+        
+        final_state.to_excel(output_path_excel)
+
+        logger.info(f"Excel report saved to: {output_path_excel}")
+        logger.info("Analysis process completed successfully")
+        
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
 
@@ -117,4 +142,10 @@ if __name__ == "__main__":
             "https://www.bankrate.com/taxes/how-bonuses-are-taxed/"
         ]
     }
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass  # uvloop is optional (unavailable on Windows); fall back to the default loop
+
     asyncio.run(main_analysis(urls["client_url"], urls["competitor_urls"], "./service_account.json", "output"))